@@ -1,25 +1,77 @@
+import asyncio
 import os
-from typing import List, Dict
+from copy import copy
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple, Union
 
 import streamlit as st
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 
 # ----------------------------- Configuration ----------------------------- #
 
 APP_TITLE = "Python Tutor Chatbot"
-DEFAULT_MODEL = "gpt-4"  # Allowed: "gpt-4" or "gpt-3.5-turbo"
-ALLOWED_MODELS = ["gpt-4", "gpt-3.5-turbo"]
+DEFAULT_MODEL = "gpt-4o-mini"  # Fast and inexpensive; larger models stay selectable
+ALLOWED_MODELS = ["gpt-4o-mini", "gpt-4o", "gpt-4", "gpt-3.5-turbo"]
 DEFAULT_TEMPERATURE = 0.3
+HISTORY_WINDOW = 20  # Number of most recent messages always rendered
+MAX_TURNS = 12  # Most recent messages always sent to the API verbatim
+SUMMARY_INTERVAL = 8  # Fold older messages into the summary in batches of this size
+API_ERROR_REPLY = "I'm having trouble reaching the language model API. Please check your API key and try again."
+
+SUGGESTED_PROMPTS = (
+    "Explain list comprehensions with two small examples.",
+    "Give me a short exercise on for-loops and range().",
+    "What are common pitfalls with mutable default arguments?",
+    "Show how to read and write a text file safely.",
+    "Explain try/except/else/finally with a minimal example.",
+    "How do I use virtual environments and why do they matter?",
+)
+
+LEVEL_OPTIONS = ("Beginner", "Intermediate", "Advanced")
+FOCUS_OPTIONS = (
+    "Fundamentals",
+    "Data Structures",
+    "Functions",
+    "OOP",
+    "File I/O",
+    "Error Handling",
+    "Testing",
+    "Typing",
+    "Performance",
+)
+STYLE_OPTIONS = (
+    "Explain, then example, then short exercise",
+    "Example-first",
+    "Exercise-first",
+    "Debugging-focused",
+)
+
+SESSION_DEFAULTS = {
+    "messages": [],
+    "model": DEFAULT_MODEL,
+    "temperature": DEFAULT_TEMPERATURE,
+    "level": LEVEL_OPTIONS[0],
+    "focus": FOCUS_OPTIONS[0],
+    "style": STYLE_OPTIONS[0],
+    "socratic": True,
+    "history_summary": "",
+    "summary_upto": 0,
+    "pending_user": None,
+    "api_errors": [],
+}
 
 
 # ----------------------------- Utilities ----------------------------- #
 
+@st.cache_resource
 def get_openai_client() -> OpenAI:
     # OpenAI SDK reads API key from environment variable: OPENAI_API_KEY
+    # Cached so the client and its connection pool are reused across reruns
     return OpenAI()
 
 
+@lru_cache(maxsize=64)
 def build_system_prompt(level: str, focus: str, style: str, socratic: bool) -> str:
     tone = "Socratic and probing while supportive" if socratic else "clear and direct with gentle guidance"
     return (
@@ -43,102 +95,285 @@ def build_system_prompt(level: str, focus: str, style: str, socratic: bool) -> s
 
 
 def init_session_state():
-    if "messages" not in st.session_state:
-        st.session_state.messages: List[Dict[str, str]] = []
-    if "model" not in st.session_state:
-        st.session_state.model = DEFAULT_MODEL
-    if "temperature" not in st.session_state:
-        st.session_state.temperature = DEFAULT_TEMPERATURE
-    if "level" not in st.session_state:
-        st.session_state.level = "Beginner"
-    if "focus" not in st.session_state:
-        st.session_state.focus = "Fundamentals"
-    if "style" not in st.session_state:
-        st.session_state.style = "Explain, then example, then short exercise"
-    if "socratic" not in st.session_state:
-        st.session_state.socratic = True
-    if "system_prompt_cache" not in st.session_state:
-        st.session_state.system_prompt_cache = ""
-
-
-def update_settings(model: str, temperature: float, level: str, focus: str, style: str, socratic: bool):
-    changed = False
-    if model != st.session_state.model:
-        st.session_state.model = model
-        changed = True
-    if abs(temperature - st.session_state.temperature) > 1e-9:
-        st.session_state.temperature = temperature
-        changed = True
-    if level != st.session_state.level:
-        st.session_state.level = level
-        changed = True
-    if focus != st.session_state.focus:
-        st.session_state.focus = focus
-        changed = True
-    if style != st.session_state.style:
-        st.session_state.style = style
-        changed = True
-    if socratic != st.session_state.socratic:
-        st.session_state.socratic = socratic
-        changed = True
-    return changed
+    for key, value in SESSION_DEFAULTS.items():
+        # Copy so mutable defaults (the message list) are never shared between sessions
+        st.session_state.setdefault(key, copy(value))
+    if not st.session_state.messages:
+        update_system_message()
+
+
+def update_system_message():
+    # The system prompt lives at messages[0] so the history can be sent as-is
+    system_message = {
+        "role": "system",
+        "content": build_system_prompt(
+            level=st.session_state.level,
+            focus=st.session_state.focus,
+            style=st.session_state.style,
+            socratic=st.session_state.socratic,
+        ),
+    }
+    messages = st.session_state.messages
+    if messages:
+        messages[0] = system_message
+    else:
+        messages.append(system_message)
 
 
 def clear_chat():
-    st.session_state.messages = []
+    del st.session_state.messages[1:]
+    st.session_state.history_summary = ""
+    st.session_state.summary_upto = 0
 
 
-def ensure_system_prompt() -> str:
-    prompt = build_system_prompt(
-        level=st.session_state.level,
-        focus=st.session_state.focus,
-        style=st.session_state.style,
-        socratic=st.session_state.socratic,
-    )
-    st.session_state.system_prompt_cache = prompt
-    return prompt
+def submit_chat_input():
+    st.session_state.messages.append({"role": "user", "content": st.session_state.chat_input})
 
 
-def generate_assistant_reply(client: OpenAI, model: str, system_prompt: str, chat_history: List[Dict[str, str]], temperature: float) -> str:
-    # Compose messages: system prompt + history
-    messages = [{"role": "system", "content": system_prompt}] + chat_history
-    response = client.chat.completions.create(
+def submit_suggestion():
+    # Only stage the prompt here; chat_panel moves it into the history
+    st.session_state.pending_user = st.session_state.suggestion
+    # Reset the selection so the pills behave like buttons
+    st.session_state.suggestion = None
+
+
+def generate_assistant_reply(client: OpenAI, model: str, messages: List[Dict[str, str]], temperature: float) -> Iterator:
+    # Stream the completion so tokens can be rendered as they arrive
+    return client.chat.completions.create(
         model=model,
         messages=messages,
         temperature=temperature,
+        stream=True,
+    )
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _cached_completion(model: str, temperature: float, messages: Tuple[Tuple[str, str], ...]) -> str:
+    response = get_openai_client().chat.completions.create(
+        model=model,
+        messages=[{"role": role, "content": content} for role, content in messages],
+        temperature=temperature,
     )
     return response.choices[0].message.content
 
 
-def suggested_prompts(level: str) -> List[str]:
-    base = [
-        "Explain list comprehensions with two small examples.",
-        "Give me a short exercise on for-loops and range().",
-        "What are common pitfalls with mutable default arguments?",
-        "Show how to read and write a text file safely.",
-        "Explain try/except/else/finally with a minimal example.",
-        "How do I use virtual environments and why do they matter?",
-    ]
-    if level == "Beginner":
-        base.extend([
-            "What is the difference between a list and a tuple?",
-            "Explain variables and types with simple examples.",
-        ])
-    elif level == "Intermediate":
-        base.extend([
-            "Demonstrate list vs dict iteration patterns and when to use each.",
-            "Show how to write a small unit test using unittest.",
-        ])
-    else:
-        base.extend([
-            "Explain decorators with a practical example.",
-            "Show how to use type hints and mypy to improve code quality.",
-        ])
-    return base[:6]
+def cached_assistant_reply(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    # Identical conversations are answered from a cache shared across sessions
+    return _cached_completion(model, temperature, tuple((m["role"], m["content"]) for m in messages))
+
+
+async def generate_assistant_replies(model: str, messages: List[Dict[str, str]], prompts: List[str], temperature: float) -> List[Union[str, BaseException]]:
+    # Answer several independent prompts concurrently against the same history.
+    # A failed request (e.g. rate limited) yields its exception without discarding the others.
+    async with AsyncOpenAI() as client:
+        responses = await asyncio.gather(*[
+            client.chat.completions.create(
+                model=model,
+                messages=messages + [{"role": "user", "content": p}],
+                temperature=temperature,
+            )
+            for p in prompts
+        ], return_exceptions=True)
+    return [r if isinstance(r, BaseException) else r.choices[0].message.content for r in responses]
+
+
+def pending_prompts(chat_history: List[Dict[str, str]]) -> List[str]:
+    # Trailing user messages that have not received an assistant reply yet
+    pending = []
+    for msg in reversed(chat_history):
+        if msg["role"] != "user":
+            break
+        pending.append(msg["content"])
+    return pending[::-1]
+
+
+def summarize_messages(client: OpenAI, model: str, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+    transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"Summary so far:\n{previous_summary}\n\nNew messages:\n{transcript}"
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Summarize this Python tutoring conversation in a few short bullet points. "
+                    "Keep topics covered, the learner's progress, and any open exercises."
+                ),
+            },
+            {"role": "user", "content": transcript},
+        ],
+        temperature=0,
+    )
+    return response.choices[0].message.content
+
+
+def windowed_history(client: OpenAI, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    # Keep recent messages verbatim and replace older ones with a running summary.
+    # The summary advances in SUMMARY_INTERVAL-sized steps, so between refreshes
+    # the verbatim tail holds MAX_TURNS to MAX_TURNS + SUMMARY_INTERVAL messages.
+    # messages[0] is the system prompt; short histories are returned without copying.
+    # A failed summary never blocks the reply: the request falls back to the last
+    # MAX_TURNS messages and the summary is retried on the next turn.
+    upto = st.session_state.summary_upto
+    start = upto or 1
+    tail_start = upto
+    if len(messages) - start > MAX_TURNS + SUMMARY_INTERVAL:
+        new_upto = len(messages) - MAX_TURNS
+        try:
+            st.session_state.history_summary = summarize_messages(
+                client, st.session_state.model, st.session_state.history_summary, messages[start:new_upto]
+            )
+            st.session_state.summary_upto = upto = tail_start = new_upto
+        except Exception:
+            tail_start = new_upto
+
+    if not tail_start:
+        return messages
+    if not upto:
+        return [messages[0]] + messages[tail_start:]
+    summary = {"role": "system", "content": f"Summary of the earlier conversation:\n{st.session_state.history_summary}"}
+    return [messages[0], summary] + messages[tail_start:]
 
 
 # ----------------------------- Streamlit App ----------------------------- #
 
+@st.fragment
+def render_sidebar():
+    # Runs as a fragment so settings changes only rerun the sidebar
+    st.header("Settings")
+    # Widgets are bound to session state through their keys
+    st.selectbox("Model", ALLOWED_MODELS, key="model")
+    st.slider("Creativity (temperature)", 0.0, 1.0, step=0.05, key="temperature")
+    st.selectbox("Level", LEVEL_OPTIONS, key="level", on_change=update_system_message)
+    st.selectbox("Focus", FOCUS_OPTIONS, key="focus", on_change=update_system_message)
+    st.selectbox("Teaching style", STYLE_OPTIONS, key="style", on_change=update_system_message)
+    st.checkbox("Socratic mode (ask guiding questions)", key="socratic", on_change=update_system_message)
+
+    col_a, col_b = st.columns(2)
+    with col_a:
+        if st.button("Clear chat"):
+            clear_chat()
+            st.rerun()
+    with col_b:
+        st.write("")  # spacing
+
+    st.divider()
+    if not os.getenv("OPENAI_API_KEY"):
+        st.warning("Set the OPENAI_API_KEY environment variable to use the tutor.")
+
+    st.caption("Tip: Adjust level, focus, and style to tailor the session.")
+
+
+@st.fragment
+def chat_panel():
+    # Runs as a fragment so a new chat turn does not rerun the rest of the page
+
+    # Move a staged suggestion into the history unless it is already awaiting a reply
+    pending_user = st.session_state.pending_user
+    if pending_user and pending_user not in pending_prompts(st.session_state.messages):
+        st.session_state.messages.append({"role": "user", "content": pending_user})
+    st.session_state.pending_user = None
+
+    # Only the most recent window is rendered; older turns are drawn on request
+    # messages[0] is the system prompt and is not displayed
+    messages = st.session_state.messages
+    split = max(1, len(messages) - HISTORY_WINDOW)
+    if split > 1 and st.toggle("Show earlier messages", key="show_earlier"):
+        for msg in messages[1:split]:
+            with st.chat_message(msg["role"]):
+                st.markdown(msg["content"])
+
+    for msg in messages[split:]:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+    # Errors from the last concurrent batch, shown once
+    for error in st.session_state.api_errors:
+        st.error(error)
+    st.session_state.api_errors.clear()
+
+    pending = pending_prompts(st.session_state.messages)
+    if len(pending) > 1:
+        answer_pending_prompts(pending)
+    elif pending:
+        stream_reply()
+
+    # Inside a fragment the input is not pinned to the page bottom, so it is drawn
+    # last and the submitted text is added to the history by its callback
+    st.chat_input(
+        "Ask about Python, request an explanation, or propose a coding exercise...",
+        key="chat_input",
+        on_submit=submit_chat_input,
+    )
+
+
+def stream_reply():
+    with st.chat_message("assistant"):
+        try:
+            with st.spinner("Thinking..."):
+                client = get_openai_client()
+                messages = windowed_history(client, st.session_state.messages)
+                # A suggested prompt opening a conversation (system + prompt) recurs
+                # across sessions, so its reply comes from the cache
+                if len(messages) == 2 and messages[-1]["content"] in SUGGESTED_PROMPTS:
+                    chunks = [cached_assistant_reply(
+                        model=st.session_state.model,
+                        messages=messages,
+                        temperature=st.session_state.temperature,
+                    )]
+                else:
+                    stream = generate_assistant_reply(
+                        client=client,
+                        model=st.session_state.model,
+                        messages=messages,
+                        temperature=st.session_state.temperature,
+                    )
+                    chunks = (chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+            reply = st.write_stream(chunks)
+        except Exception as e:
+            st.error(f"API error: {e}")
+            reply = API_ERROR_REPLY
+            st.markdown(reply)
+    st.session_state.messages.append({"role": "assistant", "content": reply})
+
+
+def answer_pending_prompts(pending: List[str]):
+    # Several prompts queued up (e.g. rapid suggestion clicks): request all replies at once
+    messages = st.session_state.messages
+    earlier = messages[:-len(pending)]
+    try:
+        with st.spinner(f"Answering {len(pending)} questions..."):
+            client = get_openai_client()
+            results = asyncio.run(generate_assistant_replies(
+                model=st.session_state.model,
+                messages=windowed_history(client, earlier),
+                prompts=pending,
+                temperature=st.session_state.temperature,
+            ))
+    except Exception as e:
+        results = [e] * len(pending)
+
+    # Only the prompts whose request failed get the fallback reply. The errors are
+    # kept in session state so chat_panel can show them after the rerun below.
+    replies = []
+    for result in results:
+        if isinstance(result, BaseException):
+            error = f"API error: {result}"
+            if error not in st.session_state.api_errors:
+                st.session_state.api_errors.append(error)
+            replies.append(API_ERROR_REPLY)
+        else:
+            replies.append(result)
+
+    # Interleave each prompt with its reply, then redraw the history in order
+    del messages[-len(pending):]
+    for prompt, reply in zip(pending, replies):
+        messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "assistant", "content": reply})
+    st.rerun()
+
+
 def main():
     st.set_page_config(page_title=APP_TITLE, page_icon="🐍", layout="wide")
     init_session_state()
@@ -148,76 +383,21 @@ def main():
 
     # Sidebar - Settings
     with st.sidebar:
-        st.header("Settings")
-        model = st.selectbox("Model", ALLOWED_MODELS, index=ALLOWED_MODELS.index(st.session_state.model))
-        temperature = st.slider("Creativity (temperature)", 0.0, 1.0, float(st.session_state.temperature), 0.05)
-        level = st.selectbox("Level", ["Beginner", "Intermediate", "Advanced"], index=["Beginner", "Intermediate", "Advanced"].index(st.session_state.level))
-        focus = st.selectbox(
-            "Focus",
-            ["Fundamentals", "Data Structures", "Functions", "OOP", "File I/O", "Error Handling", "Testing", "Typing", "Performance"],
-            index=0 if st.session_state.focus not in ["Fundamentals", "Data Structures", "Functions", "OOP", "File I/O", "Error Handling", "Testing", "Typing", "Performance"] else
-                  ["Fundamentals", "Data Structures", "Functions", "OOP", "File I/O", "Error Handling", "Testing", "Typing", "Performance"].index(st.session_state.focus)
-        )
-        style = st.selectbox(
-            "Teaching style",
-            ["Explain, then example, then short exercise", "Example-first", "Exercise-first", "Debugging-focused"],
-            index=0 if st.session_state.style not in ["Explain, then example, then short exercise", "Example-first", "Exercise-first", "Debugging-focused"] else
-                  ["Explain, then example, then short exercise", "Example-first", "Exercise-first", "Debugging-focused"].index(st.session_state.style)
-        )
-        socratic = st.checkbox("Socratic mode (ask guiding questions)", value=st.session_state.socratic)
-        changed = update_settings(model, temperature, level, focus, style, socratic)
-
-        col_a, col_b = st.columns(2)
-        with col_a:
-            if st.button("Clear chat"):
-                clear_chat()
-        with col_b:
-            st.write("")  # spacing
-
-        st.divider()
-        if not os.getenv("OPENAI_API_KEY"):
-            st.warning("Set the OPENAI_API_KEY environment variable to use the tutor.")
-
-        st.caption("Tip: Adjust level, focus, and style to tailor the session.")
+        render_sidebar()
 
     # Suggestion chips
     st.subheader("Try a prompt")
-    cols = st.columns(3)
-    prompts = suggested_prompts(st.session_state.level)
-    for i, p in enumerate(prompts):
-        if cols[i % 3].button(p, key=f"suggest_{i}"):
-            st.session_state.messages.append({"role": "user", "content": p})
-
-    # Display chat history
-    for msg in st.session_state.messages:
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
-
-    # Chat input
-    user_input = st.chat_input("Ask about Python, request an explanation, or propose a coding exercise...")
-    if user_input:
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        with st.chat_message("user"):
-            st.markdown(user_input)
-
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    client = get_openai_client()
-                    system_prompt = ensure_system_prompt()
-                    reply = generate_assistant_reply(
-                        client=client,
-                        model=st.session_state.model,
-                        system_prompt=system_prompt,
-                        chat_history=st.session_state.messages,
-                        temperature=st.session_state.temperature,
-                    )
-                except Exception as e:
-                    st.error(f"API error: {e}")
-                    reply = "I'm having trouble reaching the language model API. Please check your API key and try again."
+    st.pills(
+        "Try a prompt",
+        SUGGESTED_PROMPTS,
+        selection_mode="single",
+        key="suggestion",
+        on_change=submit_suggestion,
+        label_visibility="collapsed",
+    )
 
-                st.markdown(reply)
-        st.session_state.messages.append({"role": "assistant", "content": reply})
+    # Chat history + input
+    chat_panel()
 
     # Footer / helper text
     st.write("")